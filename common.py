@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Helpers shared by the labs
+
+A lab run as a script appends the repository root to sys.path to import
+this module. To import a lab as a module, put the root on sys.path first.
+"""
+from itertools import islice
+from multiprocessing import Pool
+
+
+class FirstFollow(object):
+    """FIRST and FOLLOW sets of all nonterminals of a grammar as bitsets
+
+    FirstFollow(grammar, end) -> sets
+    * grammar - dictionary {'T': terminals, 'N': nonterminals,
+      'P': {nonterminal: [rule, ...]}, 'S': start symbol}, rule is a tuple
+      of symbols or '' for empty rule.
+    * end - end of chain marker, it follows the start symbol.
+    Symbol s.symbols[i] is bit 1 << i, end and the empty chain '' have bits
+    too. s.first and s.follow map nonterminals to bitsets. Both are found
+    by worklist fixpoint, a nonterminal is processed again only when a set
+    it depends on grows.
+    """
+    def __init__(self, grammar, end):
+        N, P = grammar['N'], grammar['P']
+        self.symbols = list(grammar['T'])
+        # symbols of rules that are not in grammar['T'] are terminals too
+        for rules in P.values():
+            for rule in rules:
+                for symbol in rule:
+                    if symbol not in N and symbol not in self.symbols:
+                        self.symbols.append(symbol)
+        self.terminals = (1 << len(self.symbols)) - 1
+        self.symbols += [end, '']
+        self.bits = dict((s, 1 << i) for i, s in enumerate(self.symbols))
+        self.empty = empty = self.bits['']
+
+        # nonterminals having A in the right part of a rule
+        users = dict((A, set()) for A in N)
+        for nonterm, rules in P.items():
+            for rule in rules:
+                for symbol in rule:
+                    if symbol in users:
+                        users[symbol].add(nonterm)
+
+        self.first = first = dict((A, 0) for A in N)
+        work = list(N)
+        queued = set(work)
+        while work:
+            A = work.pop()
+            queued.discard(A)
+            s = first[A]
+            for rule in P[A]:
+                s |= self.chain_first(rule)
+            if s != first[A]:
+                first[A] = s
+                for B in users[A]:
+                    if B not in queued:
+                        queued.add(B)
+                        work.append(B)
+
+        self.follow = follow = dict((A, 0) for A in N)
+        follow[grammar['S']] = self.bits[end]
+        work = list(N)
+        queued = set(work)
+        while work:
+            A = work.pop()
+            queued.discard(A)
+            for rule in P[A]:
+                # FIRST of the chain after i-th symbol, from right to left
+                rest = empty
+                for i in range(len(rule) - 1, -1, -1):
+                    X = rule[i]
+                    if X in follow:
+                        s = follow[X] | rest & ~empty
+                        if rest & empty:
+                            s |= follow[A]
+                        if s != follow[X]:
+                            follow[X] = s
+                            if X not in queued:
+                                queued.add(X)
+                                work.append(X)
+                        x_first = first[X]
+                    else:
+                        x_first = self.bits[X]
+                    rest = x_first & ~empty | (rest if x_first & empty else 0)
+
+    def chain_first(self, chain):
+        """s.chain_first(chain) -> FIRST bitset of chain of symbols"""
+        s = 0
+        for symbol in chain:
+            if symbol in self.first:
+                symbols_first = self.first[symbol]
+            else:
+                symbols_first = self.bits[symbol]
+            s |= symbols_first & ~self.empty
+            if not symbols_first & self.empty:
+                return s
+        return s | self.empty
+
+    def symbols_of(self, bits):
+        """s.symbols_of(bits) -> list of symbols of bitset"""
+        return [s for i, s in enumerate(self.symbols) if bits >> i & 1]
+
+
+def first_follow(grammar, end):
+    """first_follow(grammar, end) -> (first, follow, first_of)
+
+    FIRST and FOLLOW sets of every nonterminal ('' is the empty chain) and
+    function first_of(chain) -> FIRST set of chain of symbols, as python
+    sets. See FirstFollow.
+    """
+    sets = FirstFollow(grammar, end)
+    first = dict((A, set(sets.symbols_of(bits)))
+                 for A, bits in sets.first.items())
+    follow = dict((A, set(sets.symbols_of(bits)))
+                  for A, bits in sets.follow.items())
+
+    def first_of(chain):
+        return set(sets.symbols_of(sets.chain_first(chain)))
+    return first, follow, first_of
+
+
+class ChainWriter(object):
+    """Buffered output of chains separated by newlines
+
+    ChainWriter(filename, buffering=1 << 16) -> writer
+    Output is the same as of '\\n'.join(chains), without trailing newline.
+    """
+    def __init__(self, filename, buffering=1 << 16):
+        self.file = open(filename, 'w', buffering)
+        self.count = 0
+
+    def write(self, chain):
+        """w.write(chain) add chain to the file"""
+        if self.count:
+            self.file.write('\n')
+        self.file.write(chain)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_chains(f, tail=True):
+    """iter_chains(file, tail=True) -> iterator over chains in the file
+
+    Reads file line by line, gives the same chains as
+    f.read().replace(" ", "").split('\\n') without reading whole file.
+    Use tail=False for a part of file that is followed by other lines, then
+    newline at the end doesn't give one more empty chain.
+    """
+    line = ''
+    for line in f:
+        if line[-1:] == '\n':
+            line = line[:-1]
+            yield line.replace(' ', '')
+            line = '\n'
+        else:
+            yield line.replace(' ', '')
+    if tail and (line == '\n' or line == ''): # newline at the end or empty
+        yield ''
+
+
+def imap_chunks(function, items, workers, chunksize=256, initializer=None,
+                initargs=()):
+    """imap_chunks(function, items, workers, chunksize=256, initializer=None,
+                   initargs=()) -> iterator
+
+    Split items to lists of chunksize items and yield one by one the results
+    of function(chunk), which returns a list, in the same order. Chunks are
+    processed by a pool of workers processes started with
+    initializer(*initargs). items are read lazily, at most 4 * workers chunks
+    ahead, so memory doesn't depend on number of items.
+    """
+    items = iter(items)
+    pool = Pool(workers, initializer, initargs)
+    try:
+        while True:
+            chunks = []
+            for k in range(4 * workers):
+                chunk = list(islice(items, chunksize))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            if not chunks:
+                break
+            for results in pool.imap(function, chunks):
+                for result in results:
+                    yield result
+    finally:
+        pool.terminate()
+        pool.join()
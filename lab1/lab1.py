@@ -1,9 +1,23 @@
 ﻿#!/usr/bin/python
 # -*- coding: utf-8 -*-
+import hashlib
+import mmap
+import os
 import random
-from multiprocessing import Process, Pool
+import shutil
+import struct
+import sys
+import tempfile
+from multiprocessing import Process, Pool, cpu_count
 from collections import defaultdict
-from itertools import combinations, permutations, chain, ifilter
+from array import array
+from bisect import bisect_left
+from itertools import permutations, chain, ifilter, islice
+
+if __name__ == '__main__': # run as a script, common.py is in the repo root
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir))
+from common import ChainWriter, iter_chains
 
 
 def show_graph(dotdata, title="xdot viewer"):
@@ -36,14 +50,36 @@ class G:
     Any symbol must be a string of length one. Rule is a string with nonterminal 
     symbol, symol "->" and >= 1 strings composed of terminals and nonterminals 
     separateg by "|".
+    Rules are parsed once to G.rules dictionary: nonterminal -> list of
+    alternatives, every alternative is a tuple of symbols.
     """
     def __init__(self, T, N, P, S):
         self.T = set(T)
         self.N = set(N)
         self.P = set(P)
         self.S = S
+        self.rules = self.parse_rules(self.P)
         self.validate()
 
+    @staticmethod
+    def parse_rules(P):
+        """G.parse_rules(P) -> dictionary nonterminal -> list of alternatives"""
+        rules = dict()
+        for rule in P:
+            L, D = rule.replace(" ", "").split('->')
+            rules.setdefault(L, []).extend(tuple(d) for d in D.split('|'))
+        return rules
+
+
+    def get_hash(self):
+        """G.get_hash() -> hex digest that is the same for equal grammars
+
+        Doesn't depend on order of symbols, rules and alternatives or spaces.
+        """
+        rules = sorted((L, sorted(set(''.join(d) for d in D)))
+                       for L, D in self.rules.items())
+        canonical = repr((sorted(self.T), sorted(self.N), rules, self.S))
+        return hashlib.sha1(canonical).hexdigest()
 
     def __str__(self):
         s = 'G = (T, N, P, S)\n'
@@ -67,15 +103,13 @@ class G:
         # intersection must be empty
         invalid_symbols.extend(self.N.intersection(self.T))
         # every rule must match specified format
+        symbols = self.N.union(self.T)
         invalid_rules = list()
-        for rule in self.P:
-            L, D = rule.replace(" ", "").split('->')
-            D = D.replace("|", "")
-            if list(filter(lambda x: x not in self.N.union(self.T), D)) \
-            or L not in self.N:
-                print L not in self.N
-                print list(filter(lambda x: x not in self.N.union(self.T), D))
-                invalid_rules.append(rule) 
+        for L, D in self.rules.items():
+            if L not in self.N or \
+               not all(x in symbols for d in D for x in d):
+                invalid_rules.append(L + ' -> ' + 
+                                     ' | '.join(''.join(d) for d in D))
 
         if invalid_symbols or invalid_rules:
             raise ValueError("Invalid symbols: " + str(invalid_symbols) + " " +
@@ -129,13 +163,12 @@ class FSM:
             for input_ in G.T:
                 self.add_input(input_)
 
-            for rule in G.P:
+            for L, D in G.rules.items():
                 extra_state_index = 1
-                L, D = rule.replace(" ", "").split('->')
-                for d in D.split('|'):
+                for d in D:
                     state_before_last_unput = L
                     if d[-1] not in self.Q:
-                        d += 'Z'
+                        d += ('Z', )
                     for input_ in d[:-2]: # add extra states if necessary 
                         state_before_last_unput = L + str(extra_state_index)
                         self.add_state(state_before_last_unput)
@@ -196,18 +229,40 @@ class FSM:
         self._state = random.choice(list(self.delta[self._state][input_]))
 
     def check_chain(self, chain_):
-        """m.check_chain(chain) -> True if chain matches grammar, else False"""
+        """m.check_chain(chain) -> True if chain matches grammar, else False
+
+        Follows every possible path at once, so the answer is correct for
+        nondeterministic automaton too. See get_simulator() for faster way.
+        """
         self.reset()
+        states = set([self.q])
         for i in chain_:
-            try:
-                self.apply_input(i)
-            except IndexError, e:
+            states = set(chain.from_iterable(
+                self.delta[state].get(i, ()) for state in states))
+            if not states:
                 return False
-        return self._state in self.F
+        return not self.F.isdisjoint(states)
 
-    def get_dot_data(self):
-        """m.get_dot_data() -> graphviz dot data"""
-        
+    def get_simulator(self, cache=True):
+        """m.get_simulator(cache=True) -> NFASimulator for the automaton"""
+        return NFASimulator(self, cache)
+
+    def get_dot_data(self, max_edges=None):
+        """m.get_dot_data(max_edges=None) -> graphviz dot data"""
+        return ''.join(self.iter_dot(max_edges))
+
+    def write_dot(self, f, max_edges=None):
+        """m.write_dot(file, max_edges=None) write graphviz dot data to file"""
+        for chunk in self.iter_dot(max_edges):
+            f.write(chunk)
+
+    def iter_dot(self, max_edges=None):
+        """m.iter_dot(max_edges=None) -> iterator over graphviz dot data chunks
+
+        Commands between the same states are drawn as one edge labeled with
+        class of inputs like [0-9+]. Edges go in BFS order from q, if
+        max_edges is given only that many of them are written.
+        """
         def sts(state): # state to string
             if type(state) is frozenset:
                 if not state: # empty set
@@ -215,67 +270,1104 @@ class FSM:
                 symbols = list(state)
                 symbols.sort()
                 return ''.join(symbols)
+            if type(state) is tuple: # product automaton state
+                return '"(' + ', '.join('Ø' if x is None else sts(x).strip('"')
+                                        for x in state) + ')"'
             return state
 
-        dotdata = ('digraph finite_state_machine {\n'
-         + 'rankdir=LR;\n'
-         + 'size="8,5"\n'
-         + 'node [shape = doublecircle]; ' + sts(self.q) + ' ' 
-         + ' '.join((sts(x) for x in self.F)) + '\n'
-         + 'node [shape = circle];'
-         )
-        for state1, inputs in self.delta.items():
-            for input_, states in inputs.items():
-                for state2 in states:
-                    dotdata += '{s1} -> {s2} [ label = "{i}" ];\n'.format(
-                                 s1=sts(state1), s2=sts(state2), i=input_)
-        return dotdata + '}'
-
-    def get_DFA(self):
-        """m.get_to_DFA() -> determenitive automaton"""
-        DFA = FSM(set(), set(), frozenset([self.q]), dict(), set())
-
-        for i in range(len(self.Q)):
-            for state in combinations(self.Q, i+1):
-                DFA.add_state(frozenset(state))
-                if 'Z' in state:
-                    DFA.add_final_state(frozenset(state))
-        DFA.add_state(frozenset())
+        def edges():
+            # BFS from q, then states that can't be reached
+            order = [self.q]
+            seen = set(order)
+            rest = iter(self.delta)
+            for i, state1 in enumerate(order):
+                targets = defaultdict(list)
+                for input_, states in self.delta.get(state1, {}).items():
+                    for state2 in states:
+                        targets[state2].append(input_)
+                        if state2 not in seen:
+                            seen.add(state2)
+                            order.append(state2)
+                for state2, inputs in targets.items():
+                    yield sts(state1), sts(state2), inputs
+                if i == len(order) - 1: # go on with unreachable state
+                    for state in rest:
+                        if state not in seen:
+                            seen.add(state)
+                            order.append(state)
+                            break
+
+        return iter_dot(sts(self.q), map(sts, self.F), edges(), max_edges)
+
+    def get_DFA(self, max_states=None, stats=None):
+        """m.get_DFA(max_states=None, stats=None) -> determenitive automaton
+
+        Subset construction that only builds states reachable from q, so the
+        cost depends on the size of the resulting DFA and not on 2^|Q|.
+        * max_states - if given, raise OverflowError once the DFA has more
+          states than that.
+        * stats - optional dictionary, filled with progress counters:
+          'states' (DFA states built), 'transitions' (DFA commands added) and
+          'visited' (subsets taken from the worklist).
+        """
+        if stats is None:
+            stats = dict()
+        stats.update(states=0, transitions=0, visited=0)
+
+        start = frozenset([self.q])
+        DFA = FSM(set(), set(), start, dict(), set())
         for input_ in self.sigma:
             DFA.add_input(input_)
 
-        for dstate in DFA.Q:
-            if dstate == frozenset():
-                continue
+        def add_dstate(dstate):
+            DFA.add_state(dstate)
+            if not self.F.isdisjoint(dstate):
+                DFA.add_final_state(dstate)
+            stats['states'] += 1
+            if max_states is not None and stats['states'] > max_states:
+                raise OverflowError('DFA has more than %d states' % max_states)
+
+        add_dstate(start)
+        worklist = [start]
+        while worklist:
+            dstate = worklist.pop()
+            stats['visited'] += 1
             for input_ in self.sigma:
                 dstate2 = set()
                 for state in dstate:
-                    dstate2.update(self.delta[state][input_])
-                DFA.add_command(dstate, input_, frozenset(dstate2))
-        # remove unreachable states
-        reachable = set([DFA.q])
-        search_queue = [DFA.q]
-        while search_queue:
-            state = search_queue.pop()
-            for input_ in DFA.sigma:
-                for state2 in DFA.delta[state][input_]:
-                    if state2 not in reachable:
-                        reachable.add(state2)
-                        search_queue.append(state2)
-        
-        if frozenset() in reachable:
-            reachable.remove(frozenset())
-        DFA.delta = dict((k, v) for k, v in DFA.delta.items() if k in reachable)
-        DFA.Q = DFA.Q.intersection(reachable)
-        DFA.F = DFA.F.intersection(reachable)
-        # there are still empty state
-        for state1 in DFA.delta:
-            for input_ in DFA.delta[state1].keys():
-                if DFA.delta[state1][input_] == set([frozenset([])]):
-                    DFA.delta[state1].pop(input_)
+                    # get() so that missing commands don't grow self.delta
+                    dstate2.update(self.delta[state].get(input_, ()))
+                if not dstate2: # empty set, no command
+                    continue
+                dstate2 = frozenset(dstate2)
+                if dstate2 not in DFA.Q:
+                    add_dstate(dstate2)
+                    worklist.append(dstate2)
+                DFA.add_command(dstate, input_, dstate2)
+                stats['transitions'] += 1
 
         return DFA
-       
+
+    def is_deterministic(self):
+        """m.is_deterministic() -> True if every command has one state"""
+        return all(len(states) <= 1
+                   for inputs in self.delta.values()
+                   for states in inputs.values())
+
+    def minimize(self):
+        """m.minimize() -> minimal determenitive automaton
+
+        Hopcroft's partition refinement, O(n*|sigma|*log n). Nondeterministic
+        automaton is determinized first. Every state of the result is one of
+        the original states representing its class of equivalent states, the
+        initial state is kept as is. States that can't lead to a final state
+        are removed, same as the empty set in get_DFA.
+        """
+        DFA = self if self.is_deterministic() else self.get_DFA()
+        sigma = sorted(DFA.sigma)
+
+        # number reachable states in BFS order, missing commands lead to dead
+        states = [DFA.q]
+        index = {DFA.q: 0}
+        for state in states:
+            for input_ in sigma:
+                for state2 in DFA.delta[state].get(input_, ()):
+                    if state2 not in index:
+                        index[state2] = len(states)
+                        states.append(state2)
+        dead = len(states)
+        n = dead + 1
+
+        # inverse[a][t] -> states having command (s, a, t)
+        inverse = [[[] for t in range(n)] for a in sigma]
+        for a, input_ in enumerate(sigma):
+            for s, state in enumerate(states):
+                targets = DFA.delta[state].get(input_, ())
+                t = index[next(iter(targets))] if targets else dead
+                inverse[a][t].append(s)
+            inverse[a][dead].append(dead)
+
+        final = set(index[state] for state in DFA.F if state in index)
+        # final states of product automaton are split by their labels too
+        labels = getattr(DFA, 'labels', dict())
+        initial = defaultdict(set)
+        for s in range(n):
+            initial[labels.get(states[s], True) if s in final else None].add(s)
+        blocks = list(initial.values())
+        block_of = [0] * n
+        for i, block in enumerate(blocks):
+            for s in block:
+                block_of[s] = i
+
+        largest = max(range(len(blocks)), key=lambda i: len(blocks[i]))
+        worklist = set((i, a) for i in range(len(blocks)) if i != largest
+                              for a in range(len(sigma)))
+        while worklist:
+            splitter, a = worklist.pop()
+            # states going into splitter block by input a, grouped by block
+            touched = defaultdict(set)
+            for t in blocks[splitter]:
+                for s in inverse[a][t]:
+                    touched[block_of[s]].add(s)
+            for i, X in touched.items():
+                if len(X) == len(blocks[i]):
+                    continue
+                # X is carved off as new block j in O(|X|)
+                blocks[i] -= X
+                j = len(blocks)
+                blocks.append(X)
+                for s in X:
+                    block_of[s] = j
+                for b in range(len(sigma)):
+                    if (i, b) in worklist:
+                        worklist.add((j, b))
+                    elif len(X) <= len(blocks[i]):
+                        worklist.add((j, b))
+                    else:
+                        worklist.add((i, b))
+
+        # smallest index of the block is its representative, so q stays q
+        representative = [states[min(block)] if min(block) < dead else None
+                          for block in blocks]
+        dead_block = block_of[dead]
+        MDFA = FSM(set(sigma), set(), DFA.q, dict(), set())
+        MDFA.add_state(DFA.q)
+        if labels:
+            MDFA.labels = dict()
+        for i, block in enumerate(blocks):
+            if i != dead_block:
+                MDFA.add_state(representative[i])
+                if min(block) in final:
+                    MDFA.add_final_state(representative[i])
+                    if labels:
+                        MDFA.labels[representative[i]] = \
+                            labels[representative[i]]
+        for i, block in enumerate(blocks):
+            if i == dead_block:
+                continue
+            s = min(block)
+            for a, input_ in enumerate(sigma):
+                targets = DFA.delta[states[s]].get(input_, ())
+                if targets:
+                    j = block_of[index[next(iter(targets))]]
+                    if j != dead_block:
+                        MDFA.add_command(representative[i], input_,
+                                         representative[j])
+        return MDFA
+
+    def compile(self, sigma=None):
+        """m.compile(sigma=None) -> CompiledDFA
+
+        Renumber states to integers in BFS order and build flat transition
+        table. Nondeterministic automaton is determinized first. Every input
+        must be a single byte string. Optional sigma adds inputs to the table
+        (with no commands), so that several automata can share one alphabet.
+        """
+        DFA = self if self.is_deterministic() else self.get_DFA()
+        sigma = sorted(DFA.sigma.union(sigma or ()))
+        for input_ in sigma:
+            if len(input_) != 1 or ord(input_) > 255:
+                raise ValueError('Input %r is not a single byte!' % input_)
+
+        # state 0 is dead, state 1 is initial
+        states = [None, DFA.q]
+        index = {DFA.q: 1}
+        for state in islice(states, 1, None):
+            for input_ in sigma:
+                for state2 in DFA.delta[state].get(input_, ()):
+                    if state2 not in index:
+                        index[state2] = len(states)
+                        states.append(state2)
+
+        width = len(sigma) + 1 # column 0 is for unknown symbols
+        table = array('l', [0]) * (len(states) * width)
+        for state, i in index.items():
+            for column, input_ in enumerate(sigma, 1):
+                targets = DFA.delta[state].get(input_, ())
+                if targets:
+                    table[i * width + column] = index[next(iter(targets))] * width
+        # label of product automaton state becomes bitmask of automata
+        labels = getattr(DFA, 'labels', None)
+        if labels:
+            finals = array('L', [0]) * len(states)
+        else:
+            finals = bytearray(len(states))
+        for state in DFA.F:
+            if state in index:
+                finals[index[state]] = sum(1 << k for k in labels[state]) \
+                                       if labels else 1
+        return CompiledDFA(''.join(sigma), table, finals, width)
+
+    def get_compact_DFA(self, max_states=None, stats=None):
+        """m.get_compact_DFA(max_states=None, stats=None) -> CompactDFA
+
+        Same subset construction as get_DFA, but subsets are integer bitsets
+        interned to state numbers and commands go straight to CompactDFA, so
+        no FSM with frozenset states is built. Arguments are the same as for
+        get_DFA.
+        """
+        if stats is None:
+            stats = dict()
+        stats.update(states=1, transitions=0, visited=0)
+        simulator = NFASimulator(self, cache=False)
+        sigma = sorted(self.sigma)
+        successors = [simulator.successors[input_] for input_ in sigma]
+        finals_mask = simulator.finals
+
+        index = {simulator.start: 0}
+        subsets = [simulator.start]
+        offsets = array('l', [0])
+        columns = array('B' if len(sigma) < 256 else 'H')
+        targets = array('l')
+        finals = bytearray()
+        # states are numbered in order of discovery and visited in the same
+        # order, so their commands are appended to the arrays one by one
+        for subset in subsets:
+            stats['visited'] += 1
+            finals.append(subset & finals_mask != 0)
+            for column, input_successors in enumerate(successors, 1):
+                subset2 = 0
+                rest = subset
+                while rest:
+                    low = rest & -rest
+                    subset2 |= input_successors[low.bit_length() - 1]
+                    rest ^= low
+                if not subset2:
+                    continue
+                state2 = index.get(subset2)
+                if state2 is None:
+                    state2 = index[subset2] = len(subsets)
+                    subsets.append(subset2)
+                    stats['states'] += 1
+                    if max_states is not None and \
+                       stats['states'] > max_states:
+                        raise OverflowError('DFA has more than %d states' %
+                                            max_states)
+                columns.append(column)
+                targets.append(state2)
+                stats['transitions'] += 1
+            offsets.append(len(targets))
+        return CompactDFA(''.join(sigma), offsets, columns, targets, finals)
+
+    def product(self, *others):
+        """m.product(m1, m2, ...) -> product automaton
+
+        Determenitive automaton that runs m, m1, m2, ... at the same time.
+        Its states are tuples of states of the automata (None for automaton
+        that has no command for the input) and its labels dictionary maps
+        every final state to frozenset of indices of the automata that accept
+        (0 for m, 1 for m1 and so on). F is set of states where at least one
+        automaton accepts, like for the union of the languages.
+        """
+        machines = [m if m.is_deterministic() else m.get_DFA()
+                    for m in (self,) + others]
+        sigma = set().union(*(m.sigma for m in machines))
+        start = tuple(m.q for m in machines)
+        P = FSM(set(sigma), set(), start, dict(), set())
+        P.labels = dict()
+
+        def add_pstate(pstate):
+            P.add_state(pstate)
+            label = frozenset(k for k, state in enumerate(pstate)
+                              if state in machines[k].F)
+            if label:
+                P.add_final_state(pstate)
+                P.labels[pstate] = label
+
+        add_pstate(start)
+        worklist = [start]
+        while worklist:
+            pstate = worklist.pop()
+            for input_ in sigma:
+                pstate2 = []
+                for m, state in zip(machines, pstate):
+                    targets = m.delta[state].get(input_) \
+                              if state is not None else None
+                    pstate2.append(next(iter(targets)) if targets else None)
+                pstate2 = tuple(pstate2)
+                if pstate2.count(None) == len(pstate2):
+                    continue
+                if pstate2 not in P.Q:
+                    add_pstate(pstate2)
+                    worklist.append(pstate2)
+                P.add_command(pstate, input_, pstate2)
+        return P
+
+    def union(self, *others):
+        """m.union(m1, ...) -> DFA accepting chains accepted by any of them"""
+        return self.product(*others)
+
+    def intersection(self, *others):
+        """m.intersection(m1, ...) -> DFA accepting chains accepted by all"""
+        P = self.product(*others)
+        P.F = set(state for state, label in P.labels.items()
+                  if len(label) == len(others) + 1)
+        P.labels = dict((state, P.labels[state]) for state in P.F)
+        return P
+
+
+def dot_label(inputs):
+    """dot_label(inputs) -> label for edge with several inputs, like [0-9+]"""
+    codes = sorted(set(ord(input_) for input_ in inputs))
+    if len(codes) == 1:
+        label = chr(codes[0])
+    else:
+        ranges = []
+        for code in codes:
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+        label = '[' + ''.join(chr(a) if a == b else
+                              chr(a) + chr(b) if a + 1 == b else
+                              chr(a) + '-' + chr(b)
+                              for a, b in ranges) + ']'
+    return label.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def iter_dot(initial, finals, edges, max_edges=None):
+    """iter_dot(initial, finals, edges, max_edges=None) -> dot data chunks
+
+    * initial - name of the initial state.
+    * finals - iterable of names of final states.
+    * edges - iterable of (state1, state2, list of inputs).
+    * max_edges - write at most that many edges.
+    """
+    yield ('digraph finite_state_machine {\n'
+           'rankdir=LR;\n'
+           'size="8,5"\n'
+           'node [shape = doublecircle]; ' + initial + ' ' 
+           + ' '.join(finals) + '\n'
+           'node [shape = circle];')
+    lines = []
+    for count, (state1, state2, inputs) in enumerate(edges):
+        if count == max_edges:
+            lines.append('// more edges are not shown\n')
+            break
+        lines.append('{s1} -> {s2} [ label = "{i}" ];\n'.format(
+                     s1=state1, s2=state2, i=dot_label(inputs)))
+        if len(lines) == 1024:
+            yield ''.join(lines)
+            lines = []
+    lines.append('}')
+    yield ''.join(lines)
+
+
+class NFASimulator(object):
+    """Simulation of nondeterministic automaton without determinization
+
+    NFASimulator(m, cache=True) -> simulator
+    * m - FSM, changes made to it later are not seen by the simulator.
+    * cache - remember every computed step (set of states, input) -> set of
+      states. That builds the part of the DFA that inputs actually visit.
+    Set of current states is an integer, bit i is set for state i.
+    """
+    def __init__(self, m, cache=True):
+        self.states = list(m.Q)
+        bits = dict((state, 1 << i) for i, state in enumerate(self.states))
+        # successors[input][i] -> bitset of states after state i by input
+        self.successors = dict()
+        for input_ in m.sigma:
+            self.successors[input_] = [
+                sum(bits[state2] for state2 in m.delta[state].get(input_, ()))
+                for state in self.states]
+        self.start = bits[m.q]
+        self.finals = sum(bits[state] for state in m.F)
+        self.cache = dict((input_, dict()) for input_ in m.sigma) \
+                     if cache else None
+
+    def step(self, states, input_):
+        """s.step(states, input) -> bitset of states after applying input"""
+        if self.cache is not None:
+            try:
+                return self.cache[input_][states]
+            except KeyError:
+                pass
+        successors = self.successors.get(input_)
+        if successors is None:
+            return 0
+        states2 = 0
+        rest = states
+        while rest:
+            low = rest & -rest
+            states2 |= successors[low.bit_length() - 1]
+            rest ^= low
+        if self.cache is not None:
+            self.cache[input_][states] = states2
+        return states2
+
+    def check_chain(self, chain_):
+        """s.check_chain(chain) -> True if chain matches grammar, else False"""
+        states = self.start
+        step = self.step
+        for i in chain_:
+            states = step(states, i)
+            if not states:
+                return False
+        return states & self.finals != 0
+
+    def get_state(self, states):
+        """s.get_state(states) -> frozenset of FSM states in bitset"""
+        return frozenset(state for i, state in enumerate(self.states)
+                         if states >> i & 1)
+
+
+class CompactDFA(object):
+    """Determenitive automaton with sparse transition store
+
+    CompactDFA(sigma, offsets, columns, targets, finals) -> automaton
+    * sigma - string of inputs, input sigma[c - 1] has column c.
+    * offsets, columns, targets - arrays, commands of state i are
+      columns[offsets[i]:offsets[i + 1]] (sorted) leading to corresponding
+      targets. Missing command means no command.
+    * finals - bytearray, finals[i] is nonzero if state i is final.
+    State 0 is initial. Usually made by FSM.get_compact_DFA().
+    """
+    __slots__ = ('sigma', 'offsets', 'columns', 'targets', 'finals')
+
+    def __init__(self, sigma, offsets, columns, targets, finals):
+        self.sigma = sigma
+        self.offsets = offsets
+        self.columns = columns
+        self.targets = targets
+        self.finals = finals
+
+    def __len__(self):
+        return len(self.finals)
+
+    def step(self, state, input_):
+        """c.step(state, input) -> next state or None if no command"""
+        column = self.sigma.find(input_) + 1
+        begin, end = self.offsets[state], self.offsets[state + 1]
+        i = bisect_left(self.columns, column, begin, end)
+        if i < end and self.columns[i] == column:
+            return self.targets[i]
+        return None
+
+    def check_chain(self, chain_):
+        """c.check_chain(chain) -> True if chain matches grammar, else False"""
+        state = 0
+        for i in chain_:
+            state = self.step(state, i)
+            if state is None:
+                return False
+        return self.finals[state] != 0
+
+    def compile(self):
+        """c.compile() -> CompiledDFA with dense table"""
+        width = len(self.sigma) + 1
+        table = array('l', [0]) * ((len(self) + 1) * width)
+        offsets, columns, targets = self.offsets, self.columns, self.targets
+        for state in range(len(self)):
+            row = (state + 1) * width
+            for i in range(offsets[state], offsets[state + 1]):
+                table[row + columns[i]] = (targets[i] + 1) * width
+        return CompiledDFA(self.sigma, table, bytearray(1) + self.finals)
+
+    def iter_dot(self, max_edges=None):
+        """c.iter_dot(max_edges=None) -> iterator over graphviz dot data chunks
+
+        Same as FSM.iter_dot, states are named by numbers.
+        """
+        def edges():
+            for state in range(len(self)):
+                targets = defaultdict(list)
+                for i in range(self.offsets[state], self.offsets[state + 1]):
+                    targets[self.targets[i]].append(
+                        self.sigma[self.columns[i] - 1])
+                for state2, inputs in sorted(targets.items()):
+                    yield str(state), str(state2), inputs
+
+        finals = (str(state) for state in range(len(self))
+                  if self.finals[state])
+        return iter_dot('0', finals, edges(), max_edges)
+
+    def get_FSM(self):
+        """c.get_FSM() -> FSM with states named by numbers, e.g. for dot"""
+        m = FSM(set(self.sigma), set(), '0', dict(), set())
+        for state in range(len(self)):
+            m.add_state(str(state))
+            if self.finals[state]:
+                m.add_final_state(str(state))
+        for state in range(len(self)):
+            for i in range(self.offsets[state], self.offsets[state + 1]):
+                m.add_command(str(state), self.sigma[self.columns[i] - 1],
+                              str(self.targets[i]))
+        return m
+
+
+class CompiledDFA(object):
+    """Determenitive automaton with flat transition table
+
+    CompiledDFA(sigma, table, finals, start=None) -> compiled automaton
+    * sigma - string of inputs, input sigma[i] is column i + 1 of the table,
+      column 0 is used for every other symbol.
+    * table - array of len(finals) * (len(sigma) + 1) items. Item 
+      table[offset + column] is offset of the next state, where offset of
+      state i is i * (len(sigma) + 1).
+    * finals - bytearray (or array for product automaton), finals[i] is
+      nonzero if state i is final.
+    * start - offset of the initial state.
+    State 0 is dead state, it must have all commands leading to itself.
+    Usually made by FSM.compile().
+    """
+    def __init__(self, sigma, table, finals, start=None):
+        self.sigma = sigma
+        self.width = len(sigma) + 1
+        self.table = table
+        self.finals = finals
+        self.start = self.width if start is None else start
+        # translation table for str.translate: byte -> column
+        cmap = bytearray(256)
+        for column, input_ in enumerate(sigma, 1):
+            cmap[ord(input_)] = column
+        self.cmap = str(cmap)
+
+    def __len__(self):
+        return len(self.finals)
+
+    def check_chain(self, chain_):
+        """d.check_chain(chain) -> True if chain matches grammar, else False"""
+        return self.classify(chain_) != 0
+
+    def classify(self, chain_):
+        """d.classify(chain) -> finals item of the state after the chain
+
+        For compiled product automaton it is bitmask of accepting automata.
+        """
+        table = self.table
+        state = self.start
+        for column in bytearray(chain_.translate(self.cmap)):
+            state = table[state + column]
+        return self.finals[state // self.width]
+
+    def get_stream_matcher(self):
+        """d.get_stream_matcher() -> DFAMatcher at the initial state"""
+        return DFAMatcher(self)
+
+    def get_source(self, name='match'):
+        """d.get_source(name='match') -> python source of matcher function
+
+        Function name(chain) -> True if chain matches, it doesn't need this
+        module, re or anything else.
+        """
+        return ('def {name}(chain_, table={table!r}, cmap={cmap!r},\n'
+                '         finals={finals!r}, width={width!r}):\n'
+                '    state = {start!r}\n'
+                '    for column in bytearray(chain_.translate(cmap)):\n'
+                '        state = table[state + column]\n'
+                '    return finals[state // width] != 0\n').format(
+                    name=name, table=tuple(self.table), cmap=self.cmap,
+                    finals=tuple(self.finals), width=self.width,
+                    start=self.start)
+
+    def get_matcher(self):
+        """d.get_matcher() -> matcher function made from d.get_source()"""
+        namespace = dict()
+        exec self.get_source() in namespace
+        return namespace['match']
+
+    def save(self, filename):
+        """d.save(filename) write automaton to binary file
+
+        File is a header followed by sigma, table and finals, every part
+        starts at offset multiple of 8. See load_compiled().
+        """
+        finals = self.finals
+        if isinstance(finals, bytearray):
+            finals = array('B', finals)
+        sections = [self.sigma, self.table.tostring(), finals.tostring()]
+        header = struct.pack(DFA_HEADER, DFA_MAGIC, self.start, len(self),
+                             self.table.typecode, self.table.itemsize,
+                             finals.typecode, finals.itemsize,
+                             *map(len, sections))
+        with open(filename, 'wb') as f:
+            f.write(header)
+            for section in sections:
+                f.write(section)
+                f.write('\0' * (-len(section) % 8))
+
+
+class DFAMatcher(object):
+    """Resumable matching of a chain that comes in chunks
+
+    DFAMatcher(d) -> matcher for CompiledDFA d
+    m.feed(chunk) can be called any number of times, m.is_accepting() tells
+    if everything fed so far matches. Chunks are never joined.
+    """
+    __slots__ = ('automaton', 'state', 'length')
+
+    def __init__(self, d):
+        self.automaton = d
+        self.reset()
+
+    def reset(self):
+        """m.reset() start over from the initial state"""
+        self.state = self.automaton.start
+        self.length = 0
+
+    def feed(self, chunk):
+        """m.feed(chunk) -> False if no continuation can match anymore"""
+        table = self.automaton.table
+        state = self.state
+        for column in bytearray(chunk.translate(self.automaton.cmap)):
+            state = table[state + column]
+        self.state = state
+        self.length += len(chunk)
+        return state != 0
+
+    def is_accepting(self):
+        """m.is_accepting() -> True if chain fed so far matches"""
+        return self.automaton.finals[self.state // self.automaton.width] != 0
+
+    def snapshot(self):
+        """m.snapshot() -> (state, length), can be given to m.restore()"""
+        return self.state, self.length
+
+    def restore(self, snapshot):
+        """m.restore(snapshot) return to the state saved by m.snapshot()"""
+        self.state, self.length = snapshot
+
+
+DFA_MAGIC = 'PLTDFA\x01\x00'
+# magic, start, states, table typecode and itemsize, finals typecode and
+# itemsize, lengths of sigma, table and finals in bytes
+DFA_HEADER = '<8sQQcBcB2xQQQ'
+
+def load_compiled(filename):
+    """load_compiled(filename) -> CompiledDFA saved by CompiledDFA.save
+
+    The file is memory mapped and its sections are copied to arrays
+    directly, without parsing. Raise ValueError if the file is not valid.
+    """
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size = struct.calcsize(DFA_HEADER)
+        if len(mm) < size:
+            raise ValueError('Not a compiled automaton file!')
+        (magic, start, states, table_type, table_size, finals_type,
+         finals_size, sigma_length, table_length, finals_length) = \
+            struct.unpack(DFA_HEADER, mm[:size])
+        if magic != DFA_MAGIC:
+            raise ValueError('Not a compiled automaton file!')
+        table = array(table_type)
+        finals = array(finals_type)
+        if table.itemsize != table_size or finals.itemsize != finals_size:
+            raise ValueError('Automaton was saved on other platform!')
+        offsets = [size]
+        for length in (sigma_length, table_length, finals_length):
+            offsets.append(offsets[-1] + length + (-length % 8))
+        if len(mm) < offsets[-1]:
+            raise ValueError('Compiled automaton file is truncated!')
+        sigma = mm[offsets[0]:offsets[0] + sigma_length]
+        table.fromstring(mm[offsets[1]:offsets[1] + table_length])
+        finals.fromstring(mm[offsets[2]:offsets[2] + finals_length])
+    finally:
+        mm.close()
+    if finals_type == 'B':
+        finals = bytearray(finals)
+    if len(finals) != states or len(table) != states * (sigma_length + 1):
+        raise ValueError('Compiled automaton file is broken!')
+    return CompiledDFA(sigma, table, finals, start)
+
+
+DFA_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'dfa_cache')
+
+def compile_grammars(grammars, cache_dir=DFA_CACHE_DIR):
+    """compile_grammars(grammars, cache_dir=DFA_CACHE_DIR) -> CompiledDFA
+
+    Compiled minimal product automaton of FSM(G) for every grammar. It is
+    saved to cache_dir under the hash of the grammars and loaded from there
+    next time. Pass cache_dir=None to disable the cache.
+    """
+    if cache_dir is not None:
+        key = hashlib.sha1(' '.join(G.get_hash() for G in grammars))
+        filename = os.path.join(cache_dir, key.hexdigest() + '.dfa')
+        try:
+            return load_compiled(filename)
+        except (IOError, ValueError, mmap.error):
+            pass
+
+    machines = [FSM(G) for G in grammars]
+    P = machines[0].product(*machines[1:]).minimize().compile()
+
+    if cache_dir is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write to other file first, so that nobody loads half written one
+        fd, temp = tempfile.mkstemp(dir=cache_dir)
+        os.close(fd)
+        try:
+            P.save(temp)
+            # stale file was rejected by load_compiled, on Windows rename
+            # doesn't replace existing file
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rename(temp, filename)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+    return P
+
+
+class _RegexParser(object):
+    """Parser of regular expression to tree for Glushkov construction
+
+    Tree nodes are tuples: ('symbol', set of inputs), ('empty', ),
+    ('concat', left, right), ('union', left, right), ('star', node),
+    ('plus', node), ('optional', node).
+    """
+    def __init__(self, pattern, sigma):
+        self.pattern = pattern
+        self.sigma = sigma
+        self.index = 0
+
+    def error(self, message):
+        raise ValueError('%s at %d in regex %r' % (message, self.index,
+                                                   self.pattern))
+
+    def peek(self):
+        return self.pattern[self.index:self.index + 1]
+
+    def take(self):
+        symbol = self.peek()
+        self.index += 1
+        return symbol
+
+    def parse(self):
+        node = self.union()
+        if self.index != len(self.pattern):
+            self.error('Unexpected ' + repr(self.peek()))
+        return node
+
+    def union(self):
+        node = self.concat()
+        while self.peek() == '|':
+            self.take()
+            node = ('union', node, self.concat())
+        return node
+
+    def concat(self):
+        node = ('empty', )
+        while self.peek() not in ('', '|', ')'):
+            item = self.repeat()
+            node = item if node == ('empty', ) else ('concat', node, item)
+        return node
+
+    def repeat(self):
+        node = self.atom()
+        while self.peek() in ('*', '+', '?'):
+            node = ({'*': 'star', '+': 'plus', '?': 'optional'}[self.take()],
+                    node)
+            # in re *?, +? and ?? are lazy, not repeated
+            if self.peek() == '?':
+                self.error('Lazy quantifiers are not supported')
+        return node
+
+    def atom(self):
+        symbol = self.take()
+        if symbol == '(':
+            node = self.union()
+            if self.take() != ')':
+                self.error("Missing ')'")
+            return node
+        if symbol == '[':
+            return ('symbol', self.character_class())
+        if symbol == '.':
+            return ('symbol', set(self.sigma))
+        if symbol == '\\':
+            symbol = self.take()
+            if not symbol:
+                self.error('Nothing to escape')
+            return ('symbol', set([symbol]))
+        if symbol in ('*', '+', '?'):
+            self.error('Nothing to repeat')
+        return ('symbol', set([symbol]))
+
+    def character_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.take()
+        symbols = set()
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            symbol = self.take()
+            if not symbol:
+                self.error("Missing ']'")
+            if symbol == '\\':
+                symbol = self.take()
+            if self.peek() == '-' and \
+               self.pattern[self.index + 1:self.index + 2] not in ('', ']'):
+                self.take()
+                last = self.take()
+                if last == '\\':
+                    last = self.take()
+                symbols.update(chr(i) for i in range(ord(symbol), ord(last) + 1))
+            else:
+                symbols.add(symbol)
+        self.take()
+        return set(self.sigma).difference(symbols) if negate else symbols
+
+
+def regex_to_FSM(pattern, sigma=None):
+    """regex_to_FSM(pattern, sigma=None) -> FSM
+
+    Nondeterministic automaton for regular expression built by Glushkov
+    construction (one state for every symbol of the expression plus initial
+    state 'q0', no empty commands). Supported: symbols, escapes like \\*,
+    '.', classes like [a-z] and [^ab], groups, '|', '*', '+' and '?'. 
+    Lazy quantifiers like *? raise ValueError.
+    * sigma - input alphabet, used by '.' and [^...]. By default it is set
+      of symbols used in the pattern.
+    Feed the result to get_DFA(), minimize() or compile() as usual.
+    """
+    if sigma is None:
+        sigma = set(c for c in pattern if c not in '()|*+?.[]^\\')
+    tree = _RegexParser(pattern, sigma).parse()
+    positions = [] # set of inputs of every position
+    follow = defaultdict(set)
+
+    def walk(node):
+        """walk(node) -> (nullable, first positions, last positions)"""
+        kind = node[0]
+        if kind == 'empty':
+            return True, set(), set()
+        if kind == 'symbol':
+            positions.append(node[1])
+            p = len(positions)
+            return False, set([p]), set([p])
+        if kind in ('concat', 'union'):
+            nullable1, first1, last1 = walk(node[1])
+            nullable2, first2, last2 = walk(node[2])
+            if kind == 'union':
+                return nullable1 or nullable2, first1 | first2, last1 | last2
+            for p in last1:
+                follow[p].update(first2)
+            return (nullable1 and nullable2,
+                    first1 | first2 if nullable1 else first1,
+                    last1 | last2 if nullable2 else last2)
+        nullable, first, last = walk(node[1])
+        if kind in ('star', 'plus'):
+            for p in last:
+                follow[p].update(first)
+        return nullable or kind != 'plus', first, last
+
+    nullable, first, last = walk(tree)
+    sigma = set(sigma).union(*positions)
+    m = FSM(set(), set(), 'q0', dict(), set())
+    for input_ in sigma:
+        m.add_input(input_)
+    m.add_state('q0')
+    for p in range(1, len(positions) + 1):
+        m.add_state('q%d' % p)
+    for state, targets in [(0, first)] + list(follow.items()):
+        for p in targets:
+            for input_ in positions[p - 1]:
+                m.add_command('q%d' % state, input_, 'q%d' % p)
+    m.set_final_states(set('q%d' % p for p in last))
+    if nullable:
+        m.add_final_state('q0')
+    return m
+
+
+def benchmark_regex(pattern, chains, sigma=None, repeat=3):
+    """benchmark_regex(pattern, chains, sigma=None, repeat=3) -> timings
+
+    Check chains by re, by compiled regex_to_FSM() automaton and by its
+    generated matcher function. Returns dictionary name -> best time in
+    seconds of the repeats. Raise AssertionError if results differ.
+    '.' and [^...] match only symbols of sigma, but in re any symbol, so
+    chains with symbols out of sigma (and of the pattern) raise ValueError.
+    """
+    import re
+    import timeit
+    regex = re.compile('(?:%s)\\Z' % pattern)
+    m = regex_to_FSM(pattern, sigma)
+    unknown = set(''.join(chains)).difference(m.sigma)
+    if unknown:
+        raise ValueError('Symbols %s are not in sigma' %
+                         ''.join(sorted(unknown)))
+    compiled = m.minimize().compile()
+    matchers = {'re': lambda c: regex.match(c) is not None,
+                'compiled': compiled.check_chain,
+                'generated': compiled.get_matcher()}
+    results = dict((name, map(matcher, chains))
+                   for name, matcher in matchers.items())
+    assert results['re'] == results['compiled'] == results['generated']
+    return dict((name, min(timeit.repeat(lambda: map(matcher, chains),
+                                         repeat=repeat, number=1)))
+                for name, matcher in matchers.items())
+
+
+def classify_many(automata, chains):
+    """classify_many(automata, chains) -> list of acceptance masks
+
+    Check every chain against every automaton. Returns one bytearray for each
+    automaton, mask[i] is 1 if the automaton accepts chains[i], else 0.
+    * automata - sequence of FSM and CompiledDFA. All FSMs are joined into
+      one compiled product automaton, so each chain is scanned once for all
+      of them.
+    * chains - iterable of strings.
+    """
+    fsms = [(k, m) for k, m in enumerate(automata) if isinstance(m, FSM)]
+    # (compiled automaton, [(mask index, bits of finals item)])
+    runs = [(m, [(k, -1)]) for k, m in enumerate(automata)
+            if not isinstance(m, FSM)]
+    if fsms:
+        P = fsms[0][1].product(*(m for k, m in fsms[1:])).compile()
+        runs.append((P, [(k, 1 << i) for i, (k, m) in enumerate(fsms)]))
+    # automata with the same translation table share translated chain
+    groups = defaultdict(list)
+    for m, outputs in runs:
+        groups[m.cmap].append((m.table, m.start, m.width, m.finals, outputs))
+
+    masks = [bytearray() for m in automata]
+    for chain_ in chains:
+        for cmap, group in groups.items():
+            columns = bytearray(chain_.translate(cmap))
+            for table, state, width, finals, outputs in group:
+                for column in columns:
+                    state = table[state + column]
+                label = finals[state // width]
+                for k, bits in outputs:
+                    masks[k].append(label & bits != 0)
+    return masks
+
+
+def iter_lines(filename, start=0, end=None):
+    """iter_lines(filename, start=0, end=None) -> iterator over lines
+
+    Lines of the file between byte offsets start and end.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        position = start
+        while end is None or position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def shard_file(filename, shards):
+    """shard_file(filename, shards) -> list of (start, end) byte ranges
+
+    Split file to at most shards parts, every part but the last one ends
+    with newline.
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for k in range(1, shards):
+            position = max(size * k // shards, bounds[-1])
+            if position > 0:
+                f.seek(position - 1)
+                f.readline() # move to the start of the next line
+            position = f.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+    bounds.append(size)
+    return zip(bounds, bounds[1:])
+
+
+def classify_stream(automata, chains, outputs):
+    """classify_stream(automata, chains, outputs) -> list of counts
+
+    Write every chain to outputs[k] where k is index of the first automaton
+    that accepts the chain, or to outputs[-1] if none accepts it.
+    * automata - sequence of FSMs, they are joined to compiled product, or
+      already compiled product automaton.
+    * chains - any iterable of chains, like iter_chains(file).
+    * outputs - len(automata) + 1 objects with write(chain) method, like
+      ChainWriter.
+    Returns number of chains written to every output.
+    """
+    if isinstance(automata, CompiledDFA):
+        P = automata
+    else:
+        P = automata[0].product(*automata[1:]).compile()
+    table, start, width, finals, cmap = \
+        P.table, P.start, P.width, P.finals, P.cmap
+    writes = [output.write for output in outputs]
+    counts = [0] * len(outputs)
+    for chain_ in chains:
+        state = start
+        for column in bytearray(chain_.translate(cmap)):
+            state = table[state + column]
+        label = finals[state // width]
+        k = (label & -label).bit_length() - 1 if label else -1
+        writes[k](chain_)
+        counts[k] += 1
+    return counts
+
+
+_worker_automaton = None
+
+def _init_worker(automaton):
+    global _worker_automaton
+    _worker_automaton = automaton
+
+
+def _classify_shard(args):
+    filename, start, end, tail, prefixes = args
+    names = [prefix + '%d' % start for prefix in prefixes]
+    writers = [ChainWriter(name) for name in names]
+    try:
+        chains = iter_chains(iter_lines(filename, start, end), tail)
+        counts = classify_stream(_worker_automaton, chains, writers)
+    finally:
+        for writer in writers:
+            writer.close()
+    return counts, names
+
+
+def classify_parallel(automata, filename, outputs, processes=None,
+                      shards=None):
+    """classify_parallel(automata, filename, outputs, processes=None,
+                         shards=None) -> list of counts
+
+    Same as classify_stream, but the file is split to shards (by default
+    one per process) classified by a pool of processes. Compiled product
+    automaton is sent to every process once. Outputs are file names, they
+    get chains in the order of the input file.
+    """
+    if isinstance(automata, CompiledDFA):
+        P = automata
+    else:
+        P = automata[0].product(*automata[1:]).compile()
+    processes = processes or cpu_count()
+    ranges = shard_file(filename, shards or processes)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        prefixes = [os.path.join(tmpdir, '%d.' % k)
+                    for k in range(len(outputs))]
+        tasks = [(filename, start, end, end == ranges[-1][1], prefixes)
+                 for start, end in ranges]
+        pool = Pool(processes, _init_worker, (P, ))
+        try:
+            results = pool.map(_classify_shard, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        totals = [0] * len(outputs)
+        for k, output in enumerate(outputs):
+            with open(output, 'wb') as f:
+                for counts, names in results:
+                    if counts[k]:
+                        if totals[k]:
+                            f.write('\n')
+                        with open(names[k], 'rb') as shard:
+                            shutil.copyfileobj(shard, f)
+                        totals[k] += counts[k]
+    finally:
+        shutil.rmtree(tmpdir)
+    return totals
+
 
 # Вариант 1
 G1 = G({'0', '1', '#'}, {'S', 'N'}, {  
@@ -327,39 +1419,42 @@ G8 = G({'a', 'b'}, {'S', 'B', 'C', 'D'}, {
     }, 'S')
 
 if __name__ == '__main__':
-    M1 = FSM(G7)
-    M2 = FSM(G8)
-    D1 = M1.get_DFA()
-    D2 = M2.get_DFA()
-    args = [(M1.get_dot_data(), u"НДКА первой грамматики"),
-            (M2.get_dot_data(), u"НДКА второй грамматики"),
-            (D1.get_dot_data(), u"ДКА первой грамматики"),
-            (D2.get_dot_data(), u"ДКА второй грамматики")]
-    # threads = [Process(target=show_graph, args=a) for a in args] 
-    # map(Process.start, threads)
-    # map(Process.join, threads)
-    from pygraphviz import AGraph
-    for data, name in args:
-        G = AGraph(data)
-        G.draw(name + '.png', prog='dot') 
-
-    with open("test.txt") as f:
-        chains = f.read().replace(" ", "").split('\n')
-
-    chains1 = []
-    chains2 = []
-    chains_no_one = []
-    for c in chains:
-        if D1.check_chain(c):
-            chains1.append(c)
-        elif D2.check_chain(c):
-            chains2.append(c)
-        else:
-            chains_no_one.append(c)
-              
-    with open("1.txt", "w") as f:
-        f.write('\n'.join(chains1))
-    with open("2.txt", "w") as f:
-        f.write('\n'.join(chains2))
-    with open("!.txt", "w") as f:
-        f.write('\n'.join(chains_no_one))
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Sort chains by grammars G7 and G8.')
+    parser.add_argument('input', nargs='?', default='test.txt',
+                        help='file with one chain per line')
+    parser.add_argument('--no-draw', action='store_true',
+                        help="don't draw automata to png files")
+    parser.add_argument('--processes', type=int, default=0,
+                        help='classify in parallel with this many processes')
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't use cache of compiled automata")
+    options = parser.parse_args()
+
+    P = compile_grammars([G7, G8],
+                         None if options.no_cache else DFA_CACHE_DIR)
+    if not options.no_draw:
+        M1 = FSM(G7)
+        M2 = FSM(G8)
+        D1 = M1.get_DFA().minimize()
+        D2 = M2.get_DFA().minimize()
+        args = [(M1.get_dot_data(), u"НДКА первой грамматики"),
+                (M2.get_dot_data(), u"НДКА второй грамматики"),
+                (D1.get_dot_data(), u"ДКА первой грамматики"),
+                (D2.get_dot_data(), u"ДКА второй грамматики")]
+        # threads = [Process(target=show_graph, args=a) for a in args] 
+        # map(Process.start, threads)
+        # map(Process.join, threads)
+        from pygraphviz import AGraph
+        for data, name in args:
+            G = AGraph(data)
+            G.draw(name + '.png', prog='dot') 
+
+    if options.processes:
+        classify_parallel(P, options.input, ["1.txt", "2.txt", "!.txt"],
+                          options.processes)
+    else:
+        with open(options.input) as f, ChainWriter("1.txt") as out1, \
+             ChainWriter("2.txt") as out2, ChainWriter("!.txt") as out_no_one:
+            classify_stream(P, iter_chains(f), [out1, out2, out_no_one])
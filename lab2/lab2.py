@@ -1,5 +1,13 @@
 ﻿#!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+from itertools import tee
+
+if __name__ == '__main__': # run as a script, common.py is in the repo root
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir))
+from common import ChainWriter, first_follow, imap_chunks, iter_chains
 
 MP_TABLE = { 
     '_' : [  '+',      '*',      '(',      ')',      'i',       '|'  ],
@@ -23,17 +31,158 @@ ACTIONS = {
       'PN': lambda s, i: (s[:-1], i[1:])
 }
 
+# Same actions as (pop stack top, chain to push, move to next input)
+ACTION_CODES = {
+    'PPHR': (True,  'HR', False),
+     'POP': (True,  '',   False),
+     'PRN': (False, 'R',  True),
+    'PPTF': (True,  'TF', False),
+     'PFN': (False, 'F',  True),
+   'PP)EN': (True,  ')E', True),
+      'PN': (True,  '',   True),
+}
+
+# Grammar that MP_TABLE is made for, ll1_table(GRAMMAR) gives the same table
+GRAMMAR = {
+    'T' : ('+', '*', '(', ')', 'i'),
+    'N' : ('E', 'H', 'R', 'T', 'F'),
+    'P' : {
+        'E' : [('R', 'H')],
+        'H' : [('+', 'R', 'H'), ''],
+        'R' : [('F', 'T')],
+        'T' : [('*', 'F', 'T'), ''],
+        'F' : [('(', 'E', ')'), ('i', )]},
+    'S' : 'E'}
+
+
+def ll1_table(grammar):
+    """ll1_table(grammar) -> (table, codes)
+
+    Make table like MP_TABLE and action codes like ACTION_CODES for LL(1)
+    grammar given as dictionary
+    {'T': terminals, 'N': nonterminals, 'P': {nonterminal: [rule, ...]},
+     'S': start symbol}
+    where rule is a tuple of symbols or '' for empty rule. Every symbol must
+    be a single character, '|' is the end of chain and '#' is the bottom of
+    the stack, as in MP_TABLE. Raise ValueError if grammar is not LL(1).
+    """
+    T, N, P = grammar['T'], grammar['N'], grammar['P']
+    first, follow, first_of = first_follow(grammar, '|')
+
+    inputs = list(T) + ['|']
+    table = dict()
+    codes = dict()
+    names = dict() # (pop, push, next) -> action
+
+    def set_action(symbol, input_, pop, push, next_):
+        # pushing the same symbol back on top of itself is not needed
+        if pop and push[:1] == symbol:
+            pop, push = False, push[1:]
+        code = (pop, push, next_)
+        action = names.get(code)
+        if action is None:
+            # names like in MP_TABLE, but e.g. (False, 'N', False) and
+            # (True, '', True) are both 'PN', the later one gets a number
+            name = ('P' if pop else '') + ('P' + push if push else '') + \
+                   ('N' if next_ else '')
+            name = action = 'POP' if name == 'P' else name
+            k = 1
+            while action in codes:
+                k += 1
+                action = '%s/%d' % (name, k)
+            names[code] = action
+        if codes.setdefault(action, code) != code:
+            raise ValueError('Action %s is both %r and %r' %
+                             (action, codes[action], code))
+        row = table.setdefault(symbol, ['REJECT'] * len(inputs))
+        column = inputs.index(input_)
+        if row[column] not in ('REJECT', action):
+            raise ValueError('Grammar is not LL(1): %s and %s for %r, %r' %
+                             (row[column], action, symbol, input_))
+        row[column] = action
+
+    for A in N:
+        table.setdefault(A, ['REJECT'] * len(inputs))
+        for rule in P[A]:
+            rule = tuple(rule)
+            rule_first = first_of(rule)
+            for input_ in rule_first.difference(['']):
+                if rule[0] == input_: # terminal is read right away
+                    set_action(A, input_, True, ''.join(reversed(rule[1:])),
+                               True)
+                else:
+                    set_action(A, input_, True, ''.join(reversed(rule)),
+                               False)
+            if '' in rule_first:
+                for input_ in follow[A]:
+                    set_action(A, input_, True, ''.join(reversed(rule)),
+                               False)
+
+    # terminals that can get to the stack are just read
+    for pop, push, next_ in list(codes.values()):
+        for symbol in push:
+            if symbol in T and symbol not in table:
+                set_action(symbol, symbol, True, '', True)
+    table['#'] = ['REJECT'] * len(inputs)
+    table['#'][-1] = 'ACCEPT'
+    table['_'] = inputs
+    return table, codes
+
+
+class _Action(object):
+    """Action like in ACTIONS made from (pop, push, next), can be pickled"""
+    def __init__(self, pop, push, next_):
+        self.pop, self.push, self.next_ = pop, push, next_
+
+    def __call__(self, s, i):
+        return ((s[:-1] if self.pop else s) + self.push,
+                i[1:] if self.next_ else i)
+
+
+def actions_from_codes(codes):
+    """actions_from_codes(codes) -> dictionary like ACTIONS for SSPDA"""
+    return dict((name, _Action(*code)) for name, code in codes.items())
+
+
+def compile_grammar(grammar, max_depth=9000):
+    """compile_grammar(grammar, max_depth=9000) -> CompiledSSPDA
+
+    Automaton for LL(1) grammar with table made by ll1_table().
+    """
+    table, codes = ll1_table(grammar)
+    return CompiledSSPDA(table, codes, max_depth, grammar['S'])
+
 
 class SSPDA:
-    """Single state pushdown automaton"""
-    def __init__(self, table=MP_TABLE, actions=ACTIONS):
-        self._stack = "#E"
+    """Single state pushdown automaton
+
+    SSPDA(table=MP_TABLE, actions=ACTIONS, max_depth=9000, start='E')
+    check_chain raises OverflowError if stack gets deeper than max_depth.
+    Stack starts with '#' and start symbol. Automaton can be pickled with
+    ACTIONS or actions made by actions_from_codes().
+    """
+    def __init__(self, table=MP_TABLE, actions=ACTIONS, max_depth=9000,
+                 start='E'):
+        self._start = '#' + start
+        self._stack = self._start
         self._table = dict(table)
         self._symbols = self._table.pop('_')
         self._actions = actions
+        self.max_depth = max_depth
     
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._actions is ACTIONS: # lambdas can't be pickled
+            state['_actions'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._actions is None:
+            self._actions = ACTIONS
+
     def reset(self):
-        self._stack = "#E"
+        self._stack = self._start
 
     def check_chain(self, chain):
         chain += '|'
@@ -44,27 +193,185 @@ class SSPDA:
                 return False
             if action == 'ACCEPT':
                 return True        
-            if len(self._stack) > 9000:
+            if len(self._stack) > self.max_depth:
                 raise OverflowError()
             self._stack, chain = self._actions[action](self._stack, chain)
 
+    def check_many(self, chains, workers=1, chunksize=256):
+        """A.check_many(chains, workers=1, chunksize=256) -> iterator
+
+        Results of check_chain for every chain, in the same order. See
+        check_many function.
+        """
+        return check_many(self, chains, workers, chunksize)
+
+
+class CompiledSSPDA:
+    """Single state pushdown automaton compiled to integer tables
+
+    CompiledSSPDA(table=MP_TABLE, codes=ACTION_CODES, max_depth=9000,
+                  start='E')
+    * table - same as for SSPDA.
+    * codes - dictionary action -> (pop, push, next) like ACTION_CODES.
+    * max_depth - check_chain raises OverflowError if stack gets deeper.
+    * start - start symbol, stack starts with '#' and it.
+    Symbols are numbered once, the chain is read by index and the stack is
+    a preallocated list of numbers with top index, so check_chain is linear
+    in chain length. The list is doubled when it is full, up to max_depth.
+    """
+    REJECT, ACCEPT = 0, 1
+
+    def __init__(self, table=MP_TABLE, codes=ACTION_CODES, max_depth=9000,
+                 start='E'):
+        table = dict(table)
+        inputs = table.pop('_')
+        self._stack_symbols = sorted(table)
+        stack_index = dict((s, i) for i, s in enumerate(self._stack_symbols))
+        # the last column is for symbols that are not inputs
+        self._inputs = dict((s, i) for i, s in enumerate(inputs))
+        self._width = width = len(inputs) + 1
+        self._end = self._inputs['|']
+
+        # actions[0] rejects, actions[1] accepts, others are from codes:
+        # new top is stack[top + base:top + base + len(push)] = push
+        self._bases = [0, 0]
+        self._pushes = [(), ()]
+        self._moves = [0, 0]
+        self._steps = [0, 0]
+        action_index = {'REJECT': self.REJECT, 'ACCEPT': self.ACCEPT}
+        for action, (pop, push, next_) in sorted(codes.items()):
+            action_index[action] = len(self._bases)
+            self._bases.append(0 if pop else 1)
+            self._pushes.append(tuple(stack_index[s] for s in push))
+            self._moves.append(len(push) - (1 if pop else 0))
+            self._steps.append(1 if next_ else 0)
+
+        self._table = [self.REJECT] * (len(self._stack_symbols) * width)
+        for symbol, actions in table.items():
+            row = stack_index[symbol] * width
+            for column, action in enumerate(actions):
+                self._table[row + column] = action_index[action]
+        self._bottom = (stack_index['#'], stack_index[start])
+        self.max_depth = max_depth
+        self._max_push = max(map(len, self._pushes))
+        self._stack = [0] * (min(max_depth, 1024) + self._max_push + 1)
+
+    def _grow(self):
+        """Make the stack list twice as long, but not longer than needed for
+        max_depth. Return new top index limit."""
+        stack = self._stack
+        limit = len(stack) - self._max_push - 1
+        if limit < self.max_depth:
+            stack.extend([0] * min(len(stack), self.max_depth - limit))
+        return min(len(stack) - self._max_push - 1, self.max_depth)
+
+    def check_chain(self, chain):
+        inputs, other = self._inputs, self._width - 1
+        columns = [inputs.get(c, other) for c in chain]
+        columns.append(self._end)
+        table, width = self._table, self._width
+        bases, pushes = self._bases, self._pushes
+        moves, steps = self._moves, self._steps
+        stack = self._stack
+        limit = min(len(stack) - self._max_push - 1, self.max_depth)
+        stack[0], stack[1] = self._bottom
+        top = 1
+        i = 0
+        while True:
+            action = table[stack[top] * width + columns[i]]
+            if action <= self.ACCEPT:
+                return action == self.ACCEPT
+            if top >= limit: # depth is top + 1
+                limit = self._grow()
+                if top >= limit:
+                    raise OverflowError()
+            base = top + bases[action]
+            push = pushes[action]
+            stack[base:base + len(push)] = push
+            top += moves[action]
+            i += steps[action]
+
+    def check_many(self, chains, workers=1, chunksize=256):
+        """A.check_many(chains, workers=1, chunksize=256) -> iterator
+
+        Results of check_chain for every chain, in the same order. See
+        check_many function.
+        """
+        return check_many(self, chains, workers, chunksize)
+
+
+_worker_automaton = None
+
+def _init_worker(automaton):
+    global _worker_automaton
+    _worker_automaton = automaton
+
+
+def _check_chains(chains):
+    return [_worker_automaton.check_chain(c) for c in chains]
+
+
+def check_many(automaton, chains, workers=1, chunksize=256):
+    """check_many(automaton, chains, workers=1, chunksize=256) -> iterator
+
+    Yield automaton.check_chain(chain) for every chain in the same order.
+    * chains - any iterable, it is read lazily.
+    * workers - number of processes. Every process gets its own copy of
+      the automaton once, at start, so the automaton must be picklable.
+    * chunksize - number of chains sent to a process at a time.
+    At most 4 * workers chunks are read ahead, so memory doesn't depend on
+    number of chains.
+    """
+    if workers <= 1:
+        return (automaton.check_chain(chain) for chain in chains)
+    return imap_chunks(_check_chains, chains, workers, chunksize,
+                       _init_worker, (automaton, ))
+
+
+def benchmark_nesting(sizes=(10 ** 4, 10 ** 5, 10 ** 6)):
+    """benchmark_nesting(sizes) -> list of (n, seconds, stack list length)
+
+    Check chains like ((...(i)...)) with n pairs of parentheses by
+    CompiledSSPDA. Time per pair should not grow with n and stack list
+    should not grow beyond what the deepest chain needs.
+    """
+    import time
+    A = CompiledSSPDA(max_depth=4 * max(sizes) + 8)
+    results = []
+    for n in sizes:
+        chain = '(' * n + 'i' + ')' * n
+        start = time.time()
+        assert A.check_chain(chain)
+        results.append((n, time.time() - start, len(A._stack)))
+    return results
+
 
 if __name__ == '__main__':
-    A = SSPDA()
-    with open("test.txt") as f:
-        chains = f.read().replace(" ", "").split('\n')
-
-    accepted = []
-    rejected = []
-    for c in chains:
-        if A.check_chain(c):
-            accepted.append(c)
-        else:
-            rejected.append(c)
-
-    with open("accepted.txt", "w") as f:
-        f.write('\n'.join(accepted))
-    with open("rejected.txt", "w") as f:
-        f.write('\n'.join(rejected))
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Sort chains from test.txt to accepted.txt and '
+                    'rejected.txt.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='check chains with this many processes')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time deeply nested chains and exit')
+    options = parser.parse_args()
+
+    if options.benchmark:
+        for n, seconds, stack in benchmark_nesting():
+            print('%8d pairs: %.3f s, %.3f us per pair, stack list %d' %
+                  (n, seconds, seconds / n * 1e6, stack))
+        sys.exit()
+
+    A = CompiledSSPDA()
+    with open("test.txt") as f, ChainWriter("accepted.txt") as accepted, \
+         ChainWriter("rejected.txt") as rejected:
+        chains, chains_to_check = tee(iter_chains(f))
+        results = A.check_many(chains_to_check, options.workers)
+        for c in chains:
+            if next(results):
+                accepted.write(c)
+            else:
+                rejected.write(c)
     
 
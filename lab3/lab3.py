@@ -1,30 +1,139 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+from collections import OrderedDict
+from itertools import tee
+
+if __name__ == '__main__': # run as a script, common.py is in the repo root
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir))
+from common import ChainWriter, first_follow, imap_chunks, iter_chains
+
+# Признак конца строки, дописывается к анализируемой строке
+END = '\0'
 
 # Рекурсивный анализатор 
 class RecursiveAnalyzer:
+    """Base of recursive descent analyzers, S() is the start rule
+
+    RecursiveAnalyzer(packrat=False, memo_size=1 << 16) -> analyzer
+    With packrat=True every rule method (method of the subclass) remembers
+    its result for (rule, position) during one find_error call, so rules
+    tried again after backtracking in choice() are not parsed again and
+    analysis takes linear time as long as memo_size entries are enough for
+    all pairs (rule, position) of the string. Least recently used entries
+    are evicted beyond memo_size. Counters memo_hits, memo_misses and
+    memo_evictions are kept over all calls, see hit_ratio().
+    """
+
+    def __init__(self, packrat=False, memo_size=1 << 16):
+        self.packrat = packrat
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.memo_hits = self.memo_misses = self.memo_evictions = 0
+        if packrat:
+            for name in dir(self.__class__):
+                if name.startswith('_') or hasattr(RecursiveAnalyzer, name):
+                    continue
+                method = getattr(self, name)
+                if callable(method):
+                    setattr(self, name, self._memoized(name, method))
+
+    def _memoized(self, name, method):
+        memo = self.memo
+
+        def rule():
+            key = (name, self.index)
+            if key in memo:
+                self.memo_hits += 1
+                result = memo[key] = memo.pop(key) # в конец очереди
+                matched, index = result
+                self.index = index
+                self.current_symbol = self.string[index]
+                if not matched:
+                    raise ValueError()
+                return
+            self.memo_misses += 1
+            try:
+                method()
+            except ValueError:
+                store(key, (False, self.index))
+                raise
+            else:
+                store(key, (True, self.index))
+
+        def store(key, result):
+            memo[key] = result
+            if len(memo) > self.memo_size:
+                memo.popitem(last=False)
+                self.memo_evictions += 1
+        return rule
+
+    def hit_ratio(self):
+        """a.hit_ratio() -> memo hits / (hits + misses), 0.0 if no lookups"""
+        lookups = self.memo_hits + self.memo_misses
+        return float(self.memo_hits) / lookups if lookups else 0.0
 
     def analyse(self, string):
-        self.string = string
+        return self.find_error(string) is None
+
+    def find_error(self, string, furthest=False):
+        """a.find_error(string, furthest=False) -> None or offset
+
+        None if string matches, otherwise offset of the symbol where analysis
+        failed, or the furthest such offset if furthest is True.
+        """
+        self.string = string + END
         self.index = 0
+        self.furthest = 0
+        self.memo.clear()
+        self.current_symbol = self.string[0]
         try:
             self.S()
         except ValueError:
-            return False
-        return self.index == len(string)
+            return self.furthest if furthest else self.index
+        if self.index != len(string):
+            return max(self.furthest, self.index) if furthest else self.index
+        return None
 
     def error(self):
+        if self.index > self.furthest:
+            self.furthest = self.index
         raise ValueError()
 
     def next_symbol(self):
         self.index += 1
+        self.current_symbol = self.string[self.index]
 
-    @property
-    def current_symbol(self):
-        try:
-            return self.string[self.index]
-        except IndexError:
-            return None
+    def expect(self, symbols):
+        """a.expect(symbols) skip current symbol if it is one of symbols"""
+        if self.current_symbol in symbols:
+            self.next_symbol()
+        else:
+            self.error()
+
+    def choice(self, *alternatives):
+        """a.choice(*alternatives) match first matching alternative
+
+        Ordered choice with backtracking. Every alternative is a sequence of
+        rule methods (called) and strings of symbols (see expect). If an
+        alternative fails, analysis goes back to the position before it and
+        tries the next one.
+        """
+        start = self.index
+        for alternative in alternatives:
+            try:
+                for item in alternative:
+                    if callable(item):
+                        item()
+                    else:
+                        self.expect(item)
+                return
+            except ValueError:
+                self.index = start
+                self.current_symbol = self.string[start]
+        self.error()
 
     def S(self):
         raise NotImplemented()
@@ -173,19 +282,403 @@ class RecursiveAnalyzer2(RecursiveAnalyzer):
         else:
             self.error()
 
+# Язык первого варианта без вынесения общих префиксов: упорядоченный выбор с
+# возвратом. Без packrat время растёт экспоненциально от вложенности скобок
+class BacktrackingAnalyzer1(RecursiveAnalyzer):
+
+    def S(self):
+        self.E()
+
+    def E(self):
+        self.choice((self.T, '+', self.E), (self.T, '-', self.E), (self.T, ))
+
+    def T(self):
+        self.choice((self.F, '*', self.T), (self.F, '/', self.T), (self.F, ))
+
+    def F(self):
+        self.choice(('(', self.E, ')'), ('abcd', '^', '234'), ('abcd', ))
+
+# Итеративные анализаторы: те же языки без рекурсии. Хвостовая рекурсия
+# (Es, Ts, Gs) заменена циклом, вложенные скобки - явным стеком
+class IterativeAnalyzer1:
+    """Same language as RecursiveAnalyzer1, without recursion"""
+
+    def analyse(self, string):
+        return self.find_error(string) is None
+
+    def find_error(self, string):
+        """a.find_error(string) -> None or offset, see RecursiveAnalyzer"""
+        s = string + END
+        i = 0
+        depth = 0 # open '(' of F
+        while True:
+            # F
+            c = s[i]
+            while c == '(':
+                depth += 1
+                i += 1
+                c = s[i]
+            if c not in 'abcd':
+                return i
+            i += 1
+            c = s[i]
+            if c == '^':
+                i += 1
+                if s[i] not in '234':
+                    return i
+                i += 1
+                c = s[i]
+            # Ts, Es and the end of F in parentheses
+            while True:
+                if c in '*/+-':
+                    i += 1
+                    break
+                if not depth:
+                    return None if i == len(string) else i
+                if c != ')':
+                    return i
+                depth -= 1
+                i += 1
+                c = s[i]
+
+
+class IterativeAnalyzer2:
+    """Same language as RecursiveAnalyzer2, without recursion"""
+
+    # what to do when E ends: F -> (E), G in Rs of F, G in Rs of S,
+    # S -> ?E:S^ before and after S, S -> R=E^
+    PAREN, ARGS, ARGS_S, COND, COND_END, ASSIGN = range(6)
+
+    def analyse(self, string):
+        return self.find_error(string) is None
+
+    def find_error(self, string):
+        """a.find_error(string) -> None or offset, see RecursiveAnalyzer"""
+        PAREN, ARGS, ARGS_S = self.PAREN, self.ARGS, self.ARGS_S
+        COND, COND_END, ASSIGN = self.COND, self.COND_END, self.ASSIGN
+        s = string + END
+        i = 0
+        stack = []
+        state_S = True # parse S, otherwise parse E
+        while True:
+            if state_S:
+                c = s[i]
+                if c == '?':
+                    i += 1
+                    stack.append(COND)
+                elif c in 'abc':
+                    i += 1
+                    c = s[i]
+                    if c == '(':
+                        i += 1
+                        stack.append(ARGS_S)
+                    elif c == '=':
+                        i += 1
+                        stack.append(ASSIGN)
+                    else:
+                        return i
+                else:
+                    return i
+                state_S = False
+
+            # F
+            c = s[i]
+            while c == '(':
+                i += 1
+                stack.append(PAREN)
+                c = s[i]
+            if c not in 'abc':
+                return i
+            i += 1
+            c = s[i]
+            if c == '(':
+                i += 1
+                stack.append(ARGS)
+                continue
+
+            # Ts, Es and whatever is waiting for the end of E
+            while True:
+                if c == '+' or c == '*':
+                    i += 1
+                    break
+                frame = stack.pop()
+                if frame == PAREN or frame == ARGS:
+                    if frame == ARGS and c == ',':
+                        i += 1
+                        stack.append(ARGS)
+                        break
+                    if c != ')':
+                        return i
+                    i += 1
+                    c = s[i]
+                elif frame == ARGS_S:
+                    if c == ',':
+                        i += 1
+                        stack.append(ARGS_S)
+                        break
+                    if c != ')':
+                        return i
+                    i += 1
+                    if s[i] != '=':
+                        return i
+                    i += 1
+                    stack.append(ASSIGN)
+                    break
+                elif frame == COND:
+                    if c != ':':
+                        return i
+                    i += 1
+                    stack.append(COND_END)
+                    state_S = True
+                    break
+                else: # ASSIGN, S is over
+                    if c != '^':
+                        return i
+                    i += 1
+                    while stack: # every S around it is over too
+                        stack.pop() # COND_END
+                        if s[i] != '^':
+                            return i
+                        i += 1
+                    return None if i == len(string) else i
+
+
+# Генератор рекурсивных анализаторов по LL(1) грамматике
+GRAMMAR1 = {
+    'T' : ('+', '-', '*', '/', '(', ')', '^', 'a', 'b', 'c', 'd', '2', '3',
+           '4'),
+    'N' : ('E', 'Es', 'T', 'Ts', 'F', 'Fs', 'I', 'N'),
+    'P' : {
+        'E'  : [('T', 'Es')],
+        'Es' : [('+', 'T', 'Es'), ('-', 'T', 'Es'), ''],
+        'T'  : [('F', 'Ts')],
+        'Ts' : [('*', 'F', 'Ts'), ('/', 'F', 'Ts'), ''],
+        'F'  : [('(', 'E', ')'), ('I', 'Fs')],
+        'Fs' : [('^', 'N'), ''],
+        'I'  : [('a', ), ('b', ), ('c', ), ('d', )],
+        'N'  : [('2', ), ('3', ), ('4', )]},
+    'S' : 'E'}
+
+GRAMMAR2 = {
+    'T' : ('?', ':', '^', '=', '(', ')', ',', '+', '*', 'a', 'b', 'c'),
+    'N' : ('S', 'R', 'Rs', 'G', 'Gs', 'E', 'Es', 'T', 'Ts', 'F', 'I'),
+    'P' : {
+        'S'  : [('?', 'E', ':', 'S', '^'), ('R', '=', 'E', '^')],
+        'R'  : [('I', 'Rs')],
+        'Rs' : [('(', 'G', ')'), ''],
+        'G'  : [('E', 'Gs')],
+        'Gs' : [(',', 'G'), ''],
+        'E'  : [('T', 'Es')],
+        'Es' : [('+', 'T', 'Es'), ''],
+        'T'  : [('F', 'Ts')],
+        'Ts' : [('*', 'F', 'Ts'), ''],
+        'F'  : [('(', 'E', ')'), ('R', )],
+        'I'  : [('a', ), ('b', ), ('c', )]},
+    'S' : 'S'}
+
+
+def generate_analyzer_source(grammar, name='GeneratedAnalyzer'):
+    """generate_analyzer_source(grammar, name) -> python source of analyzer
+
+    Source of RecursiveAnalyzer subclass for LL(1) grammar given as
+    dictionary like GRAMMAR1. There is a method for every nonterminal, the
+    rule is chosen by checking current symbol against FIRST set of the rule
+    (a class attribute frozenset), right recursion like Es -> + T Es is a
+    loop. Raise ValueError if grammar is not LL(1).
+    """
+    first, follow, first_of = first_follow(grammar, END)
+    methods = dict((A, 'p_' + ''.join(c if c.isalnum() else '_%d' % ord(c)
+                                      for c in A))
+                   for A in grammar['N'])
+    lines = ['class %s(RecursiveAnalyzer):' % name, '',
+             '    def S(self):',
+             '        self.%s()' % methods[grammar['S']]]
+    constants = []
+
+    def body(rule, indent, skip_first):
+        code = []
+        for i, symbol in enumerate(rule):
+            if symbol in methods:
+                code.append(indent + 'self.%s()' % methods[symbol])
+            elif i == 0 and skip_first: # already checked by dispatch
+                code.append(indent + 'self.next_symbol()')
+            else:
+                code += [indent + 'if self.current_symbol == %r:' % symbol,
+                         indent + '    self.next_symbol()',
+                         indent + 'else:',
+                         indent + '    self.error()']
+        return code or [indent + 'pass']
+
+    for A in sorted(grammar['N']):
+        rules = [tuple(rule) for rule in grammar['P'][A]]
+        alternatives = [rule for rule in rules if rule]
+        empty = len(alternatives) < len(rules)
+        # right recursion A -> x A | ... | '' becomes loop
+        loop = empty and alternatives and all(rule[-1] == A
+                                              for rule in alternatives)
+        seen = set()
+        branches = []
+        for k, rule in enumerate(alternatives):
+            rule_first = first_of(rule)
+            if '' in rule_first:
+                empty = True
+            rule_first.discard('')
+            if seen.intersection(rule_first):
+                raise ValueError('Grammar is not LL(1): rules of %s have '
+                                 'common FIRST symbols %s' %
+                                 (A, sorted(seen.intersection(rule_first))))
+            seen.update(rule_first)
+            if len(rule_first) == 1:
+                test = 'c == %r' % tuple(rule_first)
+            else:
+                test = 'c in self.FIRST_%s_%d' % (methods[A][2:], k)
+                constants.append('    FIRST_%s_%d = frozenset(%r)' %
+                                 (methods[A][2:], k, sorted(rule_first)))
+            skip_first = len(rule_first) == 1 and rule[0] in rule_first
+            branches.append((test, rule[:-1] if loop else rule, skip_first))
+        if empty and seen.intersection(follow[A]):
+            raise ValueError('Grammar is not LL(1): FIRST and FOLLOW of %s '
+                             'have common symbols %s' %
+                             (A, sorted(seen.intersection(follow[A]))))
+
+        lines += ['', '    def %s(self):' % methods[A]]
+        indent = '        '
+        if loop:
+            lines.append(indent + 'while True:')
+            indent += '    '
+        lines.append(indent + 'c = self.current_symbol')
+        for k, (test, rule, skip_first) in enumerate(branches):
+            lines.append(indent + '%s %s:' % ('if' if k == 0 else 'elif', test))
+            lines += body(rule, indent + '    ', skip_first)
+        if loop:
+            lines += [indent + 'else:', indent + '    break']
+        elif not empty:
+            lines += [indent + 'else:', indent + '    self.error()']
+
+    return '\n'.join(lines[:1] + constants + lines[1:]) + '\n'
+
+
+def make_analyzer(grammar, name='GeneratedAnalyzer'):
+    """make_analyzer(grammar, name) -> class made by generate_analyzer_source"""
+    # __name__ makes the class belong to this module, so it can be pickled
+    namespace = {'RecursiveAnalyzer': RecursiveAnalyzer, '__name__': __name__}
+    exec(generate_analyzer_source(grammar, name), namespace)
+    return namespace[name]
+
+
+GeneratedAnalyzer1 = make_analyzer(GRAMMAR1, 'GeneratedAnalyzer1')
+GeneratedAnalyzer2 = make_analyzer(GRAMMAR2, 'GeneratedAnalyzer2')
+
+
+# Классификация цепочек несколькими анализаторами за один проход
+_worker_analyzers = None
+
+def _init_worker(analyzers):
+    global _worker_analyzers
+    _worker_analyzers = analyzers
+
+
+def _classify_chains(chains):
+    return [tuple(a.analyse(c) for a in _worker_analyzers) for c in chains]
+
+
+def classify(chains, analyzers, workers=1, chunksize=256):
+    """classify(chains, analyzers, workers=1, chunksize=256) -> iterator
+
+    Yield tuple of a.analyse(chain) for a in analyzers for every chain in
+    the same order, so every chain is analysed once by every analyzer.
+    * chains - any iterable, it is read lazily.
+    * workers - number of processes, each gets its own analyzers at start.
+    * chunksize - number of chains sent to a process at a time.
+    At most 4 * workers chunks are read ahead.
+    """
+    analyzers = tuple(analyzers)
+    if workers <= 1:
+        return (tuple(a.analyse(chain) for a in analyzers) for chain in chains)
+    return imap_chunks(_classify_chains, chains, workers, chunksize,
+                       _init_worker, (analyzers, ))
+
+
+def benchmark(n=10 ** 6):
+    """benchmark(n) -> list of (analyzer, chain, seconds or error)
+
+    Check long chains of about n tokens of both grammars by recursive,
+    generated and iterative analyzers.
+    """
+    import time
+    sums = ('a+' * (n // 2))[:-1]
+    nested = '(' * (n // 2) + 'a' + ')' * (n // 2)
+    analyzers1 = (RecursiveAnalyzer1, GeneratedAnalyzer1, IterativeAnalyzer1)
+    analyzers2 = (RecursiveAnalyzer2, GeneratedAnalyzer2, IterativeAnalyzer2)
+    chains = [
+        (analyzers1, 'a+a+...', sums),
+        (analyzers1, '((...))', nested),
+        (analyzers2, 'a=a+a+...^', 'a=' + sums + '^'),
+        (analyzers2, 'a=((...))^', 'a=' + nested + '^'),
+        (analyzers2, '?a:?a:...a=a^^...^',
+         '?a:' * (n // 4) + 'a=a^' + '^' * (n // 4)),
+    ]
+    results = []
+    for analyzers, name, chain in chains:
+        for analyzer in (A() for A in analyzers):
+            start = time.time()
+            try:
+                assert analyzer.analyse(chain)
+                result = time.time() - start
+            except RuntimeError as e: # maximum recursion depth exceeded
+                result = e
+            results.append((analyzer.__class__.__name__, name, result))
+    return results
+
+
+def benchmark_packrat(depths=(2, 3, 4, 5)):
+    """benchmark_packrat(depths) -> list of (depth, seconds, seconds, ratio)
+
+    Check chains like ((...(a)...)) by BacktrackingAnalyzer1 without and
+    with packrat mode, ratio is memo hit ratio of the packrat analyzer.
+    """
+    import time
+    results = []
+    for depth in depths:
+        chain = '(' * depth + 'a' + ')' * depth
+        times = []
+        for analyzer in (BacktrackingAnalyzer1(),
+                         BacktrackingAnalyzer1(packrat=True)):
+            start = time.time()
+            assert analyzer.analyse(chain)
+            times.append(time.time() - start)
+        results.append((depth, times[0], times[1], analyzer.hit_ratio()))
+    return results
+
+
 if __name__ == '__main__':
-    with open("test.txt") as f:
-        chains = f.read().replace(" ", "").split('\n')
-    rc1 = RecursiveAnalyzer1()
-    rc2 = RecursiveAnalyzer2()
-
-    chains1 = filter(rc1.analyse, chains)
-    chains2 = filter(rc2.analyse, chains)
-    other = filter(lambda x: not (rc1.analyse(x) or rc2.analyse(x)), chains)
-
-    with open("1.txt", "w") as f:
-        f.write('\n'.join(chains1))
-    with open("2.txt", "w") as f:
-        f.write('\n'.join(chains2))
-    with open("!.txt", "w") as f:
-        f.write('\n'.join(other))
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Sort chains from test.txt to 1.txt, 2.txt and !.txt.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='analyse chains with this many processes')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time analyzers on long chains and exit')
+    options = parser.parse_args()
+
+    if options.benchmark:
+        for analyzer, chain, result in benchmark():
+            print('%s, %s: %s' % (analyzer, chain, result))
+        for depth, plain, packrat, ratio in benchmark_packrat():
+            print('BacktrackingAnalyzer1, depth %d: %.4f s, packrat %.4f s, '
+                  'hit ratio %.2f' % (depth, plain, packrat, ratio))
+        sys.exit()
+
+    analyzers = (RecursiveAnalyzer1(), RecursiveAnalyzer2())
+    with open("test.txt") as f, ChainWriter("1.txt") as chains1, \
+         ChainWriter("2.txt") as chains2, ChainWriter("!.txt") as other:
+        chains, chains_to_check = tee(iter_chains(f))
+        results = classify(chains_to_check, analyzers, options.workers)
+        for c in chains:
+            in1, in2 = next(results)
+            if in1:
+                chains1.write(c)
+            if in2:
+                chains2.write(c)
+            if not (in1 or in2):
+                other.write(c)
@@ -1,93 +1,95 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import os
+import sys
+
+if __name__ == '__main__': # run as a script, common.py is in the repo root
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir))
+from common import FirstFollow
+
 
 class LL1PDA:
     """Pushdown automaton for LL(1) grammar"""
 
     def __init__(self, G):
         self.__dict__.update(G)
+        self.sets = sets = FirstFollow(G, '$')
         table = dict([(A, dict()) for A in self.N])
         for nonterm, rules in self.P.items():
+            follow = sets.symbols_of(sets.follow[nonterm])
             for rule in rules:
                 if rule == '':
-                    for term in self.follow(nonterm):
+                    for term in follow:
                         table[nonterm][term] = tuple()
                     continue
-                for term in filter(lambda e: e in self.T, self.first(rule)):
+                first = sets.chain_first(rule)
+                for term in sets.symbols_of(first & sets.terminals):
                     table[nonterm][term] = rule
-                if '' in self.first(rule):
-                    for term in self.follow(nonterm):
+                if first & sets.empty:
+                    for term in follow:
                         table[nonterm][term] = rule
         self.table = table
+        # for check_chain: stack top is the end of list, so rules are reversed
+        self.reversed_table = dict(
+            (A, dict((term, tuple(reversed(rule)))
+                     for term, rule in rules.items()))
+            for A, rules in table.items())
+        self.terminals = frozenset(self.T)
 
     def first(self, alpha):
-        s = set()
-        # if symbol
+        """a.first(alpha) -> FIRST set of symbol or chain of symbols"""
         if type(alpha) is str:
-            # if terminal
-            if alpha in self.T:
-                return set([alpha])
-            # else checking rules
-            for rule in self.P[alpha]:
-                if rule == '':
-                    s.add('')
-                else:
-                    s.update(self.first(rule))
-        # if chain
-        else:
-            for i, symbol in enumerate(alpha):
-                symbols_first = self.first(symbol)
-                s.update(symbols_first.difference(['']))
-                if '' not in symbols_first:
-                    break
-                if i == len(alpha) - 1 and '' in symbols_first:
-                    s.add('')
-        return s
+            alpha = (alpha, )
+        return set(self.sets.symbols_of(self.sets.chain_first(alpha)))
 
     def follow(self, X):
-        s = set()
-        # if X is axiom
-        if X == self.S:
-            s.add('$')
-        # for each rule that have X in right part
-        for nonterm, rules in self.P.items():
-            for rule in filter(lambda e: X in e, rules):
-                # for each X in rule
-                for i, x in filter(lambda e: e[1] == X, enumerate(rule)):
-                    # if it isn't last one
-                    if i < len(rule) - 1:
-                        # for rule like A -> aXb b is the following chain
-                        following_chain = rule[i + 1:]
-                        following_first = self.first(following_chain)
-                        s.update(following_first.difference(['']))
-                        # if folowing chain can become empty
-                        if '' in following_first:
-                            # do the same thing as X was at the end
-                            s.update(self.follow(nonterm))
-                    # if X at the end, than it can have same follow as 
-                    # nondeterminate on the left side
-                    else:
-                        if nonterm != X:
-                            s.update(self.follow(nonterm))
-        return s
+        """a.follow(X) -> FOLLOW set of nonterminal X"""
+        return set(self.sets.symbols_of(self.sets.follow[X]))
 
     def check_chain(self, chain):
         chain = chain.split() + ['$']
-        stack = [self.S, '$']
-        
+        stack = ['$', self.S]
+        table = self.reversed_table
+        terminals = self.terminals
+        i = 0
+
         while True:
-            if stack[0] in self.N:
-                try:
-                    rule = self.table[stack[0]][chain[0]]
-                    stack.pop(0)
-                    stack = list(rule) + stack
-                except KeyError:
+            top = stack[-1]
+            if top in table:
+                rules = table[top]
+                term = chain[i]
+                if term not in rules:
                     return False
-            elif stack[0] in self.T:
-                if stack.pop(0) != chain.pop(0):
+                stack.pop()
+                stack.extend(rules[term])
+            elif top in terminals:
+                if stack.pop() != chain[i]:
                     return False
-            elif stack[0] == '$':
-                return stack[0] == chain[0]
+                i += 1
+            elif top == '$':
+                return top == chain[i]
+
+
+def benchmark(sizes=(10 ** 4, 10 ** 5, 10 ** 6)):
+    """benchmark(sizes) -> list of (chain name, tokens, seconds)
+
+    Check chains of G1 with about n tokens: long 'true or true or ...' and
+    deeply nested '( ( ... true ... ) )'. Time per token should not grow
+    with n.
+    """
+    import time
+    automaton = LL1PDA(G1)
+    results = []
+    for n in sizes:
+        chains = [('or', ' or '.join(['true'] * (n // 2 + 1))),
+                  ('nested', '( ' * (n // 2) + 'true' + ' )' * (n // 2))]
+        for name, chain in chains:
+            tokens = len(chain.split())
+            start = time.time()
+            assert automaton.check_chain(chain)
+            results.append((name, tokens, time.time() - start))
+    return results
 
 
 # Grammar 1
@@ -115,6 +117,12 @@ G2 = {
 
 
 if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        for name, tokens, seconds in benchmark():
+            print('%-6s %8d tokens: %.3f s, %.3f us per token' %
+                  (name, tokens, seconds, seconds / tokens * 1e6))
+        sys.exit()
+
     automaton1 = LL1PDA(G1)
     automaton2 = LL1PDA(G2)
 